@@ -1,28 +1,97 @@
-from flask import Flask, request, jsonify, g, Response  # Added Response
+from flask import Flask, request, jsonify, g, Response, stream_with_context  # Added Response
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
 import sqlite3
 import os
-from typing import List
+import atexit
+import functools
+import hashlib
+import queue
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from operator import attrgetter
+import threading
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import random
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "practice.db")
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")  # optional, not required for schema
 
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson; keys stay sorted like Flask's default."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        # hand orjson's bytes straight to the response, skipping a decode/encode
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_SORT_KEYS), mimetype="application/json"
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# journal_mode=WAL is stored in the database file, so it only needs setting once
+_wal_enabled = False
+
+# idle connections reused across requests. A request checks one out in
+# get_db() and hands it back at teardown, so no two threads share one at a time.
+_POOL_SIZE = 8
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
+
+
+def _connect() -> sqlite3.Connection:
+    global _wal_enabled
+    db = sqlite3.connect(
+        DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, cached_statements=256
+    )
+    if not _wal_enabled:
+        db.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    # remaining pragmas are per-connection
+    db.executescript(
+        """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;  -- ~20MB
+    PRAGMA mmap_size=268435456;
+    PRAGMA foreign_keys=ON;
+    """
+    )
+    db.row_factory = sqlite3.Row
+    return db
+
 
 def get_db():
     db = getattr(g, "_db", None)
     if db is None:
-        db = g._db = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
-        db.row_factory = sqlite3.Row
+        try:
+            db = _pool.get_nowait()
+        except queue.Empty:
+            db = _connect()
+        g._db = db
     return db
 
 
+@atexit.register
+def _close_pool():
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
 def init_db():
     db = get_db()
     db.executescript(
@@ -36,7 +105,7 @@ def init_db():
     );
 
     CREATE TABLE IF NOT EXISTS measure_groups (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      id TEXT PRIMARY KEY,
       song_id INTEGER NOT NULL,
       start_measure INTEGER NOT NULL,
       end_measure INTEGER NOT NULL,
@@ -47,9 +116,10 @@ def init_db():
     CREATE TABLE IF NOT EXISTS practice_sessions (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       song_id INTEGER NOT NULL,
-      measure_group_id INTEGER NOT NULL,
+      measure_group_id TEXT NOT NULL,
       practiced_at TEXT DEFAULT (datetime('now')),
-      rating TEXT CHECK (rating IN ('easy','medium','hard','snooze')) NOT NULL,
+      practiced_at_epoch INTEGER DEFAULT (strftime('%s','now')),
+      rating INTEGER NOT NULL CHECK (rating BETWEEN 0 AND 3),
       duration_seconds INTEGER,
       notes TEXT,
       FOREIGN KEY (song_id) REFERENCES songs(id),
@@ -57,115 +127,496 @@ def init_db():
     );
     """
     )
+    _migrate_practice_sessions(db)
+    db.executescript(
+        """
+    CREATE INDEX IF NOT EXISTS idx_ps_mg ON practice_sessions(measure_group_id);
+    CREATE INDEX IF NOT EXISTS idx_ps_song_practiced ON practice_sessions(song_id, practiced_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_ps_epoch ON practice_sessions(song_id, practiced_at_epoch DESC);
+    -- covers the per-group aggregate in _SQL_MEASURE_STATS without touching the table
+    CREATE INDEX IF NOT EXISTS idx_ps_song_mg ON practice_sessions(song_id, measure_group_id, rating, practiced_at_epoch);
+    CREATE INDEX IF NOT EXISTS idx_mg_song_range ON measure_groups(song_id, start_measure, end_measure);
+    CREATE INDEX IF NOT EXISTS idx_songs_source ON songs(source_file);
+    """
+    )
     db.commit()
 
 
-# Initialize with app context
-os.makedirs(DATA_DIR, exist_ok=True)
-with app.app_context():
+def _migrate_practice_sessions(db):
+    """Bring practice_sessions tables from older schemas up to date."""
+    # practiced_at_epoch: ALTER TABLE can't take a non-constant default,
+    # so inserts set it explicitly
+    columns = {r["name"]: r["type"] for r in db.execute("PRAGMA table_info(practice_sessions)")}
+    if "practiced_at_epoch" not in columns:
+        db.execute("ALTER TABLE practice_sessions ADD COLUMN practiced_at_epoch INTEGER")
+        db.execute("UPDATE practice_sessions SET practiced_at_epoch = strftime('%s', practiced_at)")
+        db.commit()
+
+    # rating used to be stored as text; SQLite can't alter a CHECK, so rebuild the table
+    if columns["rating"].upper() == "TEXT":
+        seq = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'practice_sessions'").fetchone()
+        # Older databases never enforced foreign keys and may hold orphan sessions;
+        # copy them as-is (the pragma can't change inside a transaction) and report below
+        db.execute("PRAGMA foreign_keys=OFF")
+        try:
+            db.executescript(
+                """
+            BEGIN;
+            CREATE TABLE practice_sessions_new (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              song_id INTEGER NOT NULL,
+              measure_group_id TEXT NOT NULL,
+              practiced_at TEXT DEFAULT (datetime('now')),
+              practiced_at_epoch INTEGER DEFAULT (strftime('%s','now')),
+              rating INTEGER NOT NULL CHECK (rating BETWEEN 0 AND 3),
+              duration_seconds INTEGER,
+              notes TEXT,
+              FOREIGN KEY (song_id) REFERENCES songs(id),
+              FOREIGN KEY (measure_group_id) REFERENCES measure_groups(id)
+            );
+            INSERT INTO practice_sessions_new
+              (id, song_id, measure_group_id, practiced_at, practiced_at_epoch, rating, duration_seconds, notes)
+            SELECT
+              id, song_id, measure_group_id, practiced_at, practiced_at_epoch,
+              CASE rating WHEN 'easy' THEN 3 WHEN 'medium' THEN 2 WHEN 'hard' THEN 1 ELSE 0 END,
+              duration_seconds, notes
+            FROM practice_sessions;
+            DROP TABLE practice_sessions;
+            ALTER TABLE practice_sessions_new RENAME TO practice_sessions;
+            COMMIT;
+            """
+            )
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        finally:
+            db.execute("PRAGMA foreign_keys=ON")
+        if seq:
+            # keep AUTOINCREMENT from reusing ids of rows deleted before the rebuild
+            db.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'practice_sessions'", (seq[0],)
+            )
+            db.commit()
+        orphans = {r[1] for r in db.execute("PRAGMA foreign_key_check(practice_sessions)")}
+        if orphans:
+            app.logger.warning(
+                "%d practice sessions reference a missing song or measure group: ids %s%s",
+                len(orphans), sorted(orphans)[:10], " ..." if len(orphans) > 10 else "",
+            )
+
+
+# Schema setup runs on the first request rather than at import time. Deployments
+# that run `flask --app app init-db` once can set PB_INIT_DB=0 so workers skip it.
+_initialized = os.environ.get("PB_INIT_DB") == "0"
+_init_lock = threading.Lock()
+
+
+def _ensure_init():
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            init_db()
+            _initialized = True
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create or migrate the database schema."""
+    os.makedirs(DATA_DIR, exist_ok=True)
     init_db()
+    print(f"Initialized {DB_PATH}")
 
 
 @app.before_request
 def before_request():
-    # Ensure DB connection exists for this request
-    get_db()
+    # connections are checked out lazily by the views that need one
+    _ensure_init()
 
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, "_db", None)
-    if db is not None:
+    # return the connection to the pool, dropping any transaction left behind
+    db = g.pop("_db", None)
+    if db is None:
+        return
+    if db.in_transaction:
+        db.rollback()
+    try:
+        _pool.put_nowait(db)
+    except queue.Full:
         db.close()
 
 
+# practice_sessions.rating stores the index into this tuple
+RATING_NAMES = ('snooze', 'hard', 'medium', 'easy')
+RATING_SCORES = {name: score for score, name in enumerate(RATING_NAMES)}
+
+
+# SQL shared by the endpoints
+_SQL_SONG_BY_ID = "SELECT * FROM songs WHERE id = ?"
+_SQL_INSERT_PRACTICE = (
+    "INSERT INTO practice_sessions (song_id, measure_group_id, rating, duration_seconds, notes, practiced_at_epoch) "
+    "VALUES (?, ?, ?, ?, ?, strftime('%s','now'))"
+)
+_SQL_INSERT_SONG = "INSERT INTO songs (title, composer, source_file, total_measures) VALUES (?, ?, ?, ?)"
+_SQL_INSERT_MEASURE_GROUP = "INSERT INTO measure_groups (id, song_id, start_measure, end_measure) VALUES (?, ?, ?, ?)"
+_SQL_LIST_SONGS = "SELECT * FROM songs ORDER BY title"
+# cheap change markers for the cached list endpoints; rows are only ever
+# inserted or deleted, which moves the max rowid or the count
+_SQL_SONGS_VERSION = "SELECT MAX(rowid), COUNT(*) FROM songs"
+_SQL_MEASURE_GROUPS_VERSION = (
+    "SELECT (SELECT MAX(rowid) FROM measure_groups), (SELECT COUNT(*) FROM measure_groups), "
+    "(SELECT MAX(rowid) FROM songs), (SELECT COUNT(*) FROM songs)"
+)
+_SQL_LIST_MEASURE_GROUPS = (
+    "SELECT mg.id, mg.song_id, mg.start_measure, mg.end_measure, mg.group_size, s.title AS song_title "
+    "FROM measure_groups mg JOIN songs s ON s.id = mg.song_id ORDER BY mg.created_at DESC"
+)
+_SQL_LIST_PRACTICE_SESSIONS = """
+    SELECT 
+        ps.id,
+        ps.song_id,
+        ps.measure_group_id,
+        ps.rating,
+        ps.practiced_at,
+        ps.duration_seconds,
+        ps.notes,
+        s.title as song_title,
+        mg.start_measure,
+        mg.end_measure
+    FROM practice_sessions ps
+    JOIN songs s ON s.id = ps.song_id
+    JOIN measure_groups mg ON mg.id = ps.measure_group_id
+    ORDER BY ps.practiced_at DESC
+"""
+_SQL_CLEAR_PRACTICE_SESSIONS = "DELETE FROM practice_sessions"
+# what a song's eligible items depend on: its newest session and its measure groups
+_SQL_ELIGIBLE_VERSION = (
+    "SELECT (SELECT MAX(id) FROM practice_sessions WHERE song_id = :song_id), "
+    "(SELECT MAX(rowid) FROM measure_groups WHERE song_id = :song_id), "
+    "(SELECT COUNT(*) FROM measure_groups WHERE song_id = :song_id)"
+)
+# per-group rating stats, trimmed to the learning window (see get_all_measures)
+_SQL_MEASURE_STATS = """
+    WITH r AS (
+        SELECT
+            measure_group_id,
+            MAX(rating) as best_rating,
+            COUNT(*) as practice_count,
+            MAX(practiced_at_epoch) as last_practiced_epoch
+        FROM practice_sessions
+        WHERE song_id = :song_id
+        GROUP BY measure_group_id
+    ),
+    agg AS (
+        SELECT
+            mg.id, mg.start_measure, mg.end_measure,
+            COALESCE(r.best_rating, 0) as best_rating,
+            COALESCE(r.practice_count, 0) as practice_count,
+            datetime(r.last_practiced_epoch, 'unixepoch') as last_practiced,
+            CASE COALESCE(r.best_rating, 0)
+                WHEN 3 THEN 'proficient'
+                WHEN 2 THEN 'decent'
+                WHEN 1 THEN 'needs_practice'
+                ELSE 'unlearned'
+            END as category
+        FROM measure_groups mg
+        LEFT JOIN r ON r.measure_group_id = mg.id
+        WHERE mg.song_id = :song_id
+    ),
+    bound AS (
+        SELECT MIN(end_measure) as window_end FROM agg WHERE best_rating < 3
+    )
+    SELECT agg.*
+    FROM agg, bound
+    WHERE bound.window_end IS NULL OR agg.end_measure <= bound.window_end + 1
+    ORDER BY agg.start_measure, agg.end_measure
+"""
+
+
 # helpers
-def row_to_dict(r: sqlite3.Row):
-    return {k: r[k] for k in r.keys()}
+def cached_query(sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+    """Run a read query at most once per request; repeats reuse the rows.
+    The cache lives on flask.g, so it is dropped with the app context.
+    """
+    cache = g.setdefault("_qcache", {})
+    key = (sql, params)
+    if key not in cache:
+        cache[key] = get_db().execute(sql, params).fetchall()
+    return cache[key]
+
 
+# Serialized bodies of rarely-changing list endpoints: key -> (version, body, etag).
+# The version is read from the database on each request, so writes made by other
+# workers or by init_db.py are picked up too.
+_list_cache: Dict[str, Tuple[tuple, bytes, str]] = {}
 
-def file_candidates_from_song_and_measure(song_row: sqlite3.Row, measure: int) -> List[str]:
-    """Construct likely filename(s) for a given song and measure.
+
+def cached_list_response(key: str, sql: str, version_sql: str) -> Response:
+    """Serve a list query from the encoded-response cache, honouring If-None-Match."""
+    db = get_db()
+    version = tuple(db.execute(version_sql).fetchone())
+    entry = _list_cache.get(key)
+    if entry is None or entry[0] != version:
+        rows = db.execute(sql).fetchall()
+        body = orjson.dumps([dict(r) for r in rows], option=orjson.OPT_SORT_KEYS)
+        entry = _list_cache[key] = (version, body, hashlib.sha1(body).hexdigest())
+    _, body, etag = entry
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+
+@functools.lru_cache(maxsize=4096)
+def file_candidates_from_song_and_measure(source_file: Optional[str], measure: int) -> Tuple[str, ...]:
+    """Construct likely filename(s) for a given song source file and measure.
     Heuristic: take song.source_file -> dirname/base; produce `${dir}/${base}_measure_${n}.musicxml`
-    and also include `.mxl` fallback.
+    and also include `.mxl` fallback. Returns a tuple, since cached results are shared between callers.
     """
-    src = song_row.get("source_file") or ""
+    src = source_file or ""
     folder = os.path.dirname(src)
     base = os.path.splitext(os.path.basename(src))[0] or ""
     prefix = (folder + "/") if folder and folder != "." else ""
-    return [f"{prefix}{base}_measure_{measure}.musicxml", f"{prefix}{base}_measure_{measure}.mxl"]
+    return (f"{prefix}{base}_measure_{measure}.musicxml", f"{prefix}{base}_measure_{measure}.mxl")
+
+
+def _is_int(value) -> bool:
+    """True for JSON integers; bool is an int subclass but not a valid id or count."""
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
 # CRUD endpoints (minimal)
 
 
+# /api/practice inserts are funnelled through one writer thread that commits
+# everything queued since its last commit in a single transaction. Callers
+# still wait on their row, so the response carries the real id and a following
+# next-measure read already sees the session.
+_PRACTICE_BATCH = 256
+# how long a request waits on the writer before giving up with a 503
+_PRACTICE_TIMEOUT = 30
+_practice_queue: "queue.Queue[Tuple[tuple, Future]]" = queue.Queue()
+_writer_lock = threading.Lock()
+_writer: Optional[threading.Thread] = None
+
+
+def _practice_writer():
+    db = None
+    while True:
+        batch = [_practice_queue.get()]
+        while len(batch) < _PRACTICE_BATCH:
+            try:
+                batch.append(_practice_queue.get_nowait())
+            except queue.Empty:
+                break
+        # drop rows whose request gave up waiting; the rest can no longer be cancelled
+        batch = [(params, fut) for params, fut in batch if fut.set_running_or_notify_cancel()]
+        if not batch:
+            continue
+
+        done = []
+        try:
+            if db is None:
+                db = _connect()
+            with db:
+                for params, fut in batch:
+                    try:
+                        done.append((fut, db.execute(_SQL_INSERT_PRACTICE, params).lastrowid, None))
+                    except sqlite3.Error as e:
+                        # only this row is rejected; the rest of the batch still commits
+                        done.append((fut, None, e))
+        except Exception as e:
+            # keep the thread alive: fail this batch and carry on with the next one
+            for _, fut in batch:
+                fut.set_exception(e)
+            continue
+
+        for fut, rowid, error in done:
+            if error is None:
+                fut.set_result(rowid)
+            else:
+                fut.set_exception(error)
+
+
+def insert_practice_session(params: tuple) -> int:
+    """Queue a practice_sessions row for the writer thread and return its id once committed.
+    Raises FutureTimeoutError if the row is still queued after _PRACTICE_TIMEOUT; it is then never written.
+    """
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _writer_lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_practice_writer, name="practice-writer", daemon=True)
+                _writer.start()
+    fut: Future = Future()
+    _practice_queue.put((params, fut))
+    try:
+        return fut.result(timeout=_PRACTICE_TIMEOUT)
+    except FutureTimeoutError:
+        # still queued: cancel it so the writer never commits it after we've given up
+        if fut.cancel():
+            raise
+    # the writer already took the row and always resolves what it takes
+    return fut.result()
+
+
 @app.route("/api/practice", methods=["POST"])
 def log_practice():
     data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "request body must be a JSON object"}), 400
     
     # Validate required fields
     rating = data.get("rating")
-    if rating not in ("easy", "medium", "hard", "snooze"):
+    if rating not in RATING_SCORES:
         return jsonify({"error": "rating required and must be one of easy/medium/hard/snooze"}), 400
     
     song_id = data.get("song_id")
     measure_group_id = data.get("measure_group_id")
     if not song_id or not measure_group_id:
         return jsonify({"error": "song_id and measure_group_id required"}), 400
+    if not _is_int(song_id) or not isinstance(measure_group_id, str):
+        return jsonify({"error": "song_id must be an integer and measure_group_id a string"}), 400
 
     # Optional fields
     duration_seconds = data.get("duration_seconds")
     notes = data.get("notes")
+    if duration_seconds is not None and not _is_int(duration_seconds):
+        return jsonify({"error": "duration_seconds must be an integer"}), 400
+    if notes is not None and not isinstance(notes, str):
+        return jsonify({"error": "notes must be a string"}), 400
     
+    try:
+        session_id = insert_practice_session(
+            (song_id, measure_group_id, RATING_SCORES[rating], duration_seconds, notes)
+        )
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "unknown song_id or measure_group_id"}), 400
+    except FutureTimeoutError:
+        return jsonify({"error": "practice log is busy; the session was not saved"}), 503
+    return jsonify({"id": session_id}), 201
+
+
+@app.route("/api/songs/bulk", methods=["POST"])
+def create_songs_bulk():
+    """Insert many songs in a single transaction"""
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "request body must be a JSON object"}), 400
+    songs = data.get("songs")
+    if not isinstance(songs, list) or not all(isinstance(s, dict) and s.get("title") for s in songs):
+        return jsonify({"error": "songs must be a list of objects with a title"}), 400
+    for s in songs:
+        if not isinstance(s["title"], str) or not all(
+            s.get(field) is None or isinstance(s[field], str) for field in ("composer", "source_file")
+        ):
+            return jsonify({"error": "title, composer and source_file must be strings"}), 400
+        if s.get("total_measures") is not None and not _is_int(s["total_measures"]):
+            return jsonify({"error": "total_measures must be an integer"}), 400
+
+    rows = [
+        (s["title"], s.get("composer"), s.get("source_file"), s.get("total_measures") or 0)
+        for s in songs
+    ]
     db = get_db()
-    cur = db.execute(
-        "INSERT INTO practice_sessions (song_id, measure_group_id, rating, duration_seconds, notes) VALUES (?, ?, ?, ?, ?)",
-        (song_id, measure_group_id, rating, duration_seconds, notes),
-    )
-    db.commit()
-    return jsonify({"id": cur.lastrowid}), 201
+    try:
+        with db:
+            db.executemany(_SQL_INSERT_SONG, rows)
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "songs violate a database constraint"}), 400
+    return jsonify({"inserted": len(rows)}), 201
+
+
+@app.route("/api/measure-groups/bulk", methods=["POST"])
+def create_measure_groups_bulk():
+    """Insert many measure groups for one song in a single transaction"""
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "request body must be a JSON object"}), 400
+    song_id = data.get("song_id")
+    groups = data.get("groups")
+    if not song_id or not isinstance(groups, list):
+        return jsonify({"error": "song_id and a list of groups required"}), 400
+    if not _is_int(song_id):
+        return jsonify({"error": "song_id must be an integer"}), 400
+    ranges = []
+    for grp in groups:
+        start = grp.get("start_measure") if isinstance(grp, dict) else None
+        end = grp.get("end_measure") if isinstance(grp, dict) else None
+        if not _is_int(start) or not _is_int(end) or not 1 <= start <= end:
+            return jsonify({"error": "each group needs integers 1 <= start_measure <= end_measure"}), 400
+        ranges.append((start, end))
+
+    songs = cached_query(_SQL_SONG_BY_ID, (song_id,))
+    if not songs:
+        return jsonify({"error": "Song not found"}), 404
+
+    # Same "<folder>|measure<start>[-<end>]" ids that init_db.py generates
+    folder = (songs[0]["source_file"] or "").split("/")[0]
+    rows = [
+        (f"{folder}|measure{start}" if start == end else f"{folder}|measure{start}-{end}", song_id, start, end)
+        for start, end in ranges
+    ]
+    db = get_db()
+    try:
+        with db:
+            db.executemany(_SQL_INSERT_MEASURE_GROUP, rows)
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "one or more measure groups already exist"}), 409
+    return jsonify({"inserted": len(rows)}), 201
 
 
 @app.route("/api/songs", methods=["GET"])
 def list_songs():
-    db = get_db()
-    rows = db.execute("SELECT * FROM songs ORDER BY title").fetchall()
-    return jsonify([row_to_dict(r) for r in rows])
+    return cached_list_response("songs", _SQL_LIST_SONGS, _SQL_SONGS_VERSION)
 
 
 @app.route("/api/measure-groups", methods=["GET"])
 def list_measure_groups():
-    db = get_db()
-    rows = db.execute(
-        "SELECT mg.*, s.title AS song_title FROM measure_groups mg JOIN songs s ON s.id = mg.song_id ORDER BY mg.created_at DESC"
-    ).fetchall()
-    return jsonify([row_to_dict(r) for r in rows])
+    return cached_list_response("measure_groups", _SQL_LIST_MEASURE_GROUPS, _SQL_MEASURE_GROUPS_VERSION)
 
 
 @app.route("/api/practice-sessions", methods=["GET"])
 def list_practice_sessions():
     """Return all practice sessions with song and measure info"""
     db = get_db()
-    rows = db.execute("""
-        SELECT 
-            ps.*,
-            s.title as song_title,
-            mg.start_measure,
-            mg.end_measure
-        FROM practice_sessions ps
-        JOIN songs s ON s.id = ps.song_id
-        JOIN measure_groups mg ON mg.id = ps.measure_group_id
-        ORDER BY ps.practiced_at DESC
-    """).fetchall()
-    return jsonify([row_to_dict(r) for r in rows])
+
+    def generate():
+        # encode row by row off the cursor so the full list is never held in memory
+        yield b"["
+        sep = b""
+        for r in db.execute(_SQL_LIST_PRACTICE_SESSIONS):
+            yield sep + orjson.dumps(dict(r, rating=RATING_NAMES[r["rating"]]), option=orjson.OPT_SORT_KEYS)
+            sep = b","
+        yield b"]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
 
 
 @app.route("/api/practice-sessions", methods=["DELETE"])
 def clear_practice_sessions():
-    """Clear all practice session history"""
+    """Clear all practice session history; ?vacuum=1 also reclaims the freed pages"""
     db = get_db()
-    db.execute("DELETE FROM practice_sessions")
+    # A bare DELETE with no WHERE takes SQLite's truncate fast path only while
+    # foreign keys are off; practice_sessions is a child table, so with them on
+    # every row is checked and deleted one by one. Nothing references it, so
+    # skipping the checks is safe. The pragma can't change inside a transaction,
+    # and the connection goes back to the pool, so always switch it back on.
     db.commit()
+    db.execute("PRAGMA foreign_keys=OFF")
+    try:
+        db.execute(_SQL_CLEAR_PRACTICE_SESSIONS)
+        db.commit()
+    finally:
+        if db.in_transaction:
+            db.rollback()
+        db.execute("PRAGMA foreign_keys=ON")
+    if request.args.get("vacuum") == "1":
+        db.execute("VACUUM")
     return jsonify({"status": "ok"})
 
 
@@ -175,7 +626,7 @@ class ProficiencyLevel(Enum):
     NEEDS_PRACTICE = 2
     UNLEARNED = 1
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class MeasureItem:
     id: str
     start: int
@@ -184,53 +635,43 @@ class MeasureItem:
     practice_count: int
     last_practiced: Optional[str]
     category: str
-
-    # Add rating scores as class variable
-    RATING_SCORES = {
-        'easy': 3,
-        'medium': 2,
-        'hard': 1,
-        'snooze': 0
-    }
     
     @property
     def is_group(self) -> bool:
         return self.start != self.end
-    
-    @classmethod
-    def from_db_row(cls, row: sqlite3.Row, ratings: List[str]) -> 'MeasureItem':
-        best_rating = max((cls.RATING_SCORES[r] for r in ratings), default=0)
-        category = (
-            'proficient' if best_rating >= 3
-            else 'decent' if best_rating >= 2
-            else 'needs_practice' if best_rating >= 1
-            else 'unlearned'
-        )
-        
-        return cls(
-            id=row['id'],
-            start=row['start_measure'],
-            end=row['end_measure'],
-            best_rating=best_rating,
-            practice_count=row['practice_count'] or 0,
-            last_practiced=row['last_practiced'],
-            category=category
-        )
+
+    @property
+    def category_rank(self) -> int:
+        # best_rating runs 0 (unrated/snooze) to 3 (easy), one step per category
+        return self.best_rating
+
+# song_id -> (_SQL_ELIGIBLE_VERSION row for the song, eligible items)
+_eligible_cache: Dict[int, Tuple[tuple, List[MeasureItem]]] = {}
 
 def get_next_measure(song_id: int):
     """Get next measure to practice using spaced repetition algorithm"""
     db = get_db()
     
     # Get song info
-    song = db.execute("SELECT * FROM songs WHERE id = ?", (song_id,)).fetchone()
-    if not song:
+    if not cached_query(_SQL_SONG_BY_ID, (song_id,)):
         return jsonify({"error": "Song not found"}), 404
 
-    measures = get_all_measures(db, song_id)
-    if not measures:
-        return jsonify({"measure": 1})
-        
-    eligible_items = get_eligible_items(measures)
+    # Eligibility only changes when a session is logged or measure groups are added,
+    # so reuse the last result while the song's version read from the database is
+    # the same; that also catches writes from other workers and init_db.py.
+    # The pick itself stays random.
+    version = tuple(db.execute(_SQL_ELIGIBLE_VERSION, {"song_id": song_id}).fetchone())
+    cached = _eligible_cache.get(song_id)
+    if cached is not None and cached[0] == version:
+        eligible_items = cached[1]
+    else:
+        measures = get_all_measures(db, song_id)
+        if not measures:
+            return jsonify({"measure": 1})
+
+        eligible_items = get_eligible_items(measures)
+        _eligible_cache[song_id] = (version, eligible_items)
+
     if not eligible_items:
         return jsonify({"measure": 1})
         
@@ -243,33 +684,25 @@ def next_measure_for_song(song_id: int):
     return get_next_measure(song_id)
 
 def get_all_measures(db, song_id: int) -> Dict[str, List[MeasureItem]]:
-    """Get all measures and their practice history"""
-    query = """
-    SELECT 
-        mg.id, mg.start_measure, mg.end_measure,
-        GROUP_CONCAT(ps.rating) as ratings,
-        COUNT(ps.id) as practice_count,
-        MAX(ps.practiced_at) as last_practiced
-    FROM measure_groups mg
-    LEFT JOIN practice_sessions ps ON mg.id = ps.measure_group_id
-    WHERE mg.song_id = ?
-    GROUP BY mg.id, mg.start_measure, mg.end_measure
-    ORDER BY mg.start_measure, mg.end_measure
+    """Get measures up to the edge of the learning window and their practice history.
+
+    The window stops at the first non-proficient item, so anything ending more
+    than one measure past it can never be eligible and is not fetched.
     """
-    
-    rows = db.execute(query, (song_id,)).fetchall()
-    single_measures = []
-    measure_groups = []
-    
-    for row in rows:
-        ratings = row['ratings'].split(',') if row['ratings'] else []
-        item = MeasureItem.from_db_row(row, ratings)
-        
-        if item.is_group:
-            measure_groups.append(item)
-        else:
-            single_measures.append(item)  # Uncommented and properly indented
-            
+    items = [
+        MeasureItem(
+            id=row['id'],
+            start=row['start_measure'],
+            end=row['end_measure'],
+            best_rating=row['best_rating'],
+            practice_count=row['practice_count'],
+            last_practiced=row['last_practiced'],
+            category=row['category'],
+        )
+        for row in db.execute(_SQL_MEASURE_STATS, {"song_id": song_id})
+    ]
+    single_measures = [m for m in items if m.start == m.end]
+    measure_groups = [m for m in items if m.start != m.end]
     return {'single': single_measures, 'groups': measure_groups}
 
 def get_eligible_items(measures: Dict[str, List[MeasureItem]]) -> List[MeasureItem]:
@@ -277,23 +710,17 @@ def get_eligible_items(measures: Dict[str, List[MeasureItem]]) -> List[MeasureIt
     single_measures = measures['single']
     measure_groups = measures['groups']
     
-    # Find current learning window
-    window_size = 1
-    max_measure = 1
-    
-    while window_size <= len(single_measures):
-        current_window = single_measures[:window_size]
-        current_groups = [
-            g for g in measure_groups 
-            if g.start >= 1 and g.end <= window_size
-        ]
-        
-        if (all(m.category == 'proficient' for m in current_window) and 
-            all(g.category == 'proficient' for g in current_groups)):
-            window_size += 1
-            max_measure = window_size
-        else:
-            break
+    # Find current learning window: it grows past every size whose leading
+    # singles and the groups ending inside it are all proficient, so it stops
+    # at the first non-proficient single or just before the first weak group.
+    window_size = next(
+        (i for i, m in enumerate(single_measures) if m.category != 'proficient'),
+        len(single_measures)
+    )
+    for g in measure_groups:
+        if g.start >= 1 and g.category != 'proficient' and g.end <= window_size:
+            window_size = g.end - 1
+    max_measure = max(window_size, 0) + 1
     
     # Get eligible items within window
     eligible_items = []
@@ -315,25 +742,22 @@ def get_eligible_items(measures: Dict[str, List[MeasureItem]]) -> List[MeasureIt
 
 def select_next_item(eligible_items: List[MeasureItem]) -> MeasureItem:
     """Select next item using weighted random selection"""
-    categorized = {
-        ProficiencyLevel.PROFICIENT: [m for m in eligible_items if m.category == 'proficient'],
-        ProficiencyLevel.DECENT: [m for m in eligible_items if m.category == 'decent'],
-        ProficiencyLevel.NEEDS_PRACTICE: [m for m in eligible_items if m.category == 'needs_practice'],
-        ProficiencyLevel.UNLEARNED: [m for m in eligible_items if m.category == 'unlearned']
-    }
-    
-    roll = random.random()
-    
-    if roll < 0.15 and categorized[ProficiencyLevel.PROFICIENT]:
-        return random.choice(categorized[ProficiencyLevel.PROFICIENT])
-    elif roll < 0.45 and categorized[ProficiencyLevel.DECENT]:
-        return random.choice(categorized[ProficiencyLevel.DECENT])
-    
-    return min(eligible_items, key=lambda m: (
-        {'unlearned': 0, 'needs_practice': 1, 'decent': 2, 'proficient': 3}[m.category],
-        m.practice_count,
-        m.start
-    ))
+    rand, choice = random.random, random.choice
+
+    # one pass, bucketed by category_rank: 0 unlearned, 1 needs_practice, 2 decent, 3 proficient
+    buckets: List[List[MeasureItem]] = [[], [], [], []]
+    for m in eligible_items:
+        buckets[m.category_rank].append(m)
+
+    roll = rand()
+
+    if roll < 0.15 and buckets[3]:
+        return choice(buckets[3])
+    elif roll < 0.45 and buckets[2]:
+        return choice(buckets[2])
+
+    lowest = next(b for b in buckets if b)
+    return min(lowest, key=attrgetter('practice_count', 'start'))
 
 def create_response(item: MeasureItem) -> Response:
     """Create JSON response for selected item"""
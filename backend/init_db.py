@@ -1,20 +1,35 @@
 import os
+import re
 import sqlite3
 from pathlib import Path
 
 DB_PATH = Path(__file__).parent / "practice.db"
 DATA_DIR = Path(__file__).parent.parent / "frontend" / "public" / "data"
 
+# measure_12.musicxml / measures_12-14.musicxml -> start, optional end
+_MEASURE_RX = re.compile(r'measures?_(\d+)(?:-(\d+))?')
+
+def _connect():
+    """Open the database in autocommit mode; callers BEGIN their own transactions"""
+    db = sqlite3.connect(DB_PATH, isolation_level=None)
+    db.executescript("""
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;  -- 64MB
+    """)
+    return db
+
 def get_db():
     """Get database connection"""
-    db = sqlite3.connect(DB_PATH)
+    db = _connect()
     db.row_factory = sqlite3.Row
     return db
 
 def init_db():
     """Initialize database schema"""
     # Use the passed db connection instead of creating a new one
-    db = sqlite3.connect(DB_PATH)
+    db = _connect()
     db.executescript("""
     CREATE TABLE IF NOT EXISTS songs (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,12 +54,18 @@ def init_db():
       song_id INTEGER NOT NULL,
       measure_group_id TEXT NOT NULL,  -- Changed to TEXT
       practiced_at TEXT DEFAULT (datetime('now')),
-      rating TEXT CHECK (rating IN ('easy','medium','hard','snooze')) NOT NULL,
+      practiced_at_epoch INTEGER DEFAULT (strftime('%s','now')),
+      rating INTEGER NOT NULL CHECK (rating BETWEEN 0 AND 3),  -- 0 snooze .. 3 easy
       duration_seconds INTEGER,
       notes TEXT,
       FOREIGN KEY (song_id) REFERENCES songs(id),
       FOREIGN KEY (measure_group_id) REFERENCES measure_groups(id)
     );
+
+    -- same names and definitions as backend/app.py, so neither side duplicates them
+    CREATE INDEX IF NOT EXISTS idx_mg_song_range ON measure_groups(song_id, start_measure, end_measure);
+    CREATE INDEX IF NOT EXISTS idx_ps_song_practiced ON practice_sessions(song_id, practiced_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_ps_mg ON practice_sessions(measure_group_id);
     """)
     db.commit()
     return db
@@ -53,59 +74,64 @@ def scan_data_dir():
     """Scan data directory for songs and their measures"""
     songs = []
     measure_groups = []
+    folder_to_source = {}
 
     # Look for song folders
-    for entry in os.scandir(DATA_DIR):
-        if not entry.is_dir():
-            continue
-        
-        print(f"Checking directory: {entry.path}")
-        
-        # Find the main song file (should match folder name)
-        song_files = []
-        for pattern in ["*.musicxml", "*.mxl"]:
-            song_files.extend(Path(entry.path).glob(pattern))
-        
-        print(f"Found files: {song_files}")
-        
-        song_file = next((f for f in song_files if "measure_" not in f.name and "measures_" not in f.name), None)
-        if not song_file:
-            print(f"No main song file found in {entry.path}")
-            continue
-
-        # Find all measure files (single and multi-measure groups)
-        all_measure_files = sorted(
-            [f for f in Path(entry.path).glob("*.musicxml") if "measure_" in f.name or "measures_" in f.name],
-            key=lambda p: (
-                # Sort by start measure, then by length of range
-                int(p.name.split("measure")[1].split("_")[1].split("-")[0].split(".")[0]),
-                len(p.name.split("-")) if "-" in p.name else 0
-            )
-        )
-        
-        # Count single measures only for total_measures
-        single_measures = [f for f in all_measure_files if "measure_" in f.name and "-" not in f.name]
-        
-        if single_measures:
-            songs.append({
-                'title': entry.name.replace('-', ' ').title(),
-                'source_file': f"{entry.name}/{song_file.name}",
-                'total_measures': len(single_measures)
-            })
-            
-            # Create measure groups for all combinations
-            for mf in all_measure_files:
-                if "measure_" in mf.name and "-" not in mf.name:
-                    # Single measure
-                    measure = int(mf.name.split("measure_")[1].split(".")[0])
-                    measure_groups.append((entry.name, measure, measure))
-                elif "measures_" in mf.name:
-                    # Multi-measure group
-                    range_part = mf.name.split("measures_")[1].split(".")[0]
-                    start, end = map(int, range_part.split("-"))
-                    measure_groups.append((entry.name, start, end))
-
-    return songs, measure_groups
+    with os.scandir(DATA_DIR) as folders:
+        for entry in folders:
+            if not entry.is_dir():
+                continue
+
+            print(f"Checking directory: {entry.path}")
+
+            # One listing per folder, split into song files and measure files
+            song_files = []
+            measure_files = []
+            with os.scandir(entry.path) as files:
+                for f in files:
+                    name = f.name
+                    if not f.is_file():
+                        continue
+                    if "measure_" in name or "measures_" in name:
+                        if name.endswith(".musicxml"):
+                            measure_files.append(name)
+                    elif name.endswith((".musicxml", ".mxl")):
+                        song_files.append(name)
+
+            print(f"Found files: {song_files + measure_files}")
+
+            # Find the main song file (should match folder name), preferring .musicxml
+            song_file = min(song_files, key=lambda n: n.endswith(".mxl"), default=None)
+            if not song_file:
+                print(f"No main song file found in {entry.path}")
+                continue
+
+            # Parse each measure file name once into (start, end); sorting the
+            # tuples orders by start measure, then by length of range
+            ranges = []
+            for name in measure_files:
+                m = _MEASURE_RX.search(name)
+                if m:
+                    start = int(m.group(1))
+                    ranges.append((start, int(m.group(2) or start)))
+            ranges.sort()
+
+            # Count single measures only for total_measures
+            single_measures = sum(1 for start, end in ranges if start == end)
+
+            if single_measures:
+                source_file = f"{entry.name}/{song_file}"
+                songs.append({
+                    'title': entry.name.replace('-', ' ').title(),
+                    'source_file': source_file,
+                    'total_measures': single_measures
+                })
+                folder_to_source[entry.name] = source_file
+
+                # Create measure groups for all combinations
+                measure_groups.extend((entry.name, start, end) for start, end in ranges)
+
+    return songs, measure_groups, folder_to_source
 
 def main():
     print(f"Scanning {DATA_DIR}")
@@ -114,7 +140,7 @@ def main():
     if DATA_DIR.exists():
         print("Contents:", list(DATA_DIR.iterdir()))
     
-    songs, measure_groups = scan_data_dir()
+    songs, measure_groups, folder_to_source = scan_data_dir()
     
     if not songs:
         print("No songs found!")
@@ -136,36 +162,49 @@ def main():
     
     # Use init_db() to create schema
     db = init_db()
+
+    # One-off bulk load: skip fsyncs but stay in WAL, since switching journal
+    # modes fails while the server holds the database open
+    db.execute("PRAGMA synchronous=OFF")
     
-    # Insert songs, keeping track of inserted IDs
-    song_ids = {}  # source_file -> id mapping
-    for song in songs:
-        cur = db.execute(
-            "INSERT INTO songs (title, source_file, total_measures) VALUES (?, ?, ?)",
-            (song['title'], song['source_file'], song['total_measures'])
-        )
-        db.commit()
-        song_ids[song['source_file'].split('/')[0]] = cur.lastrowid
-    
-    # Insert measure groups
-    for folder, start_measure, end_measure in measure_groups:
-        song_id = song_ids.get(folder)
-        if not song_id:
-            print(f"Warning: no song found for measure in {folder}")
-            continue
-        
-        # Construct the measure group ID
-        if start_measure == end_measure:
-            measure_id = f"{folder}|measure{start_measure}"
-        else:
-            measure_id = f"{folder}|measure{start_measure}-{end_measure}"
-        
-        db.execute(
-            "INSERT INTO measure_groups (id, song_id, start_measure, end_measure) VALUES (?, ?, ?, ?)",
-            (measure_id, song_id, start_measure, end_measure)
-        )
-    
-    db.commit()
+    # Everything goes in as one transaction; the connection is in autocommit
+    # mode, so open it explicitly and let the context manager commit or roll back
+    try:
+        with db:
+            db.execute("BEGIN")
+            # Insert songs in one batch, then read back their IDs
+            db.executemany(
+                "INSERT INTO songs (title, source_file, total_measures) VALUES (?, ?, ?)",
+                [(s['title'], s['source_file'], s['total_measures']) for s in songs]
+            )
+            # ordered by id so the newest import wins if a source file is already there
+            source_ids = dict(db.execute("SELECT source_file, id FROM songs ORDER BY id"))
+            song_ids = {folder: source_ids[src] for folder, src in folder_to_source.items()}  # folder -> id
+
+            # Resolve measure groups to rows, then insert them in one batch
+            rows = []
+            for folder, start_measure, end_measure in measure_groups:
+                song_id = song_ids.get(folder)
+                if not song_id:
+                    print(f"Warning: no song found for measure in {folder}")
+                    continue
+
+                # Construct the measure group ID
+                if start_measure == end_measure:
+                    measure_id = f"{folder}|measure{start_measure}"
+                else:
+                    measure_id = f"{folder}|measure{start_measure}-{end_measure}"
+                rows.append((measure_id, song_id, start_measure, end_measure))
+
+            db.executemany(
+                "INSERT INTO measure_groups (id, song_id, start_measure, end_measure) VALUES (?, ?, ?, ?)",
+                rows
+            )
+    finally:
+        db.execute("PRAGMA synchronous=NORMAL")
+
+    # Refresh planner statistics now that the tables are populated
+    db.execute("ANALYZE")
     print("Done!")
 
 if __name__ == "__main__":
@@ -1,65 +1,263 @@
 import os
 from pathlib import Path
 import re
-from music21 import converter, stream
+import shutil
+import copy
+import zipfile
+import xml.etree.ElementTree as ET
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from enum import Enum
-from typing import Dict, List, Set, Tuple
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+_NORMALIZE_RE = re.compile(r'[^a-zA-Z0-9]+')
 
 def normalize_name(filename: str) -> str:
     """Convert filename to a normalized folder name"""
     # Remove extension
     base = Path(filename).stem
     # Convert spaces/special chars to dashes, lowercase
-    normalized = re.sub(r'[^a-zA-Z0-9]+', '-', base).lower()
+    normalized = _NORMALIZE_RE.sub('-', base).lower()
     # Remove leading/trailing dashes
     return normalized.strip('-')
 
+def _mxl_rootfile(zf: zipfile.ZipFile) -> Optional[str]:
+    """Path of the score inside an .mxl archive, from META-INF/container.xml"""
+    container = ET.fromstring(zf.read("META-INF/container.xml"))
+    rootfile = container.find(".//{*}rootfile")
+    return rootfile.get("full-path") if rootfile is not None else None
+
+def count_measures(input_file: Path) -> int:
+    """Count the first part's <measure> elements without parsing the whole score
+    Returns 0 if the layout isn't recognised, so callers fall back to parsing.
+    """
+    if input_file.suffix == ".mxl":
+        with zipfile.ZipFile(input_file) as zf:
+            rootfile = _mxl_rootfile(zf)
+            if rootfile is None:
+                return 0
+            with zf.open(rootfile) as fh:
+                return _count_first_part_measures(fh)
+    with open(input_file, "rb") as fh:
+        return _count_first_part_measures(fh)
+
+def _count_first_part_measures(fh) -> int:
+    count = 0
+    for _, elem in ET.iterparse(fh):
+        if elem.tag == "measure":
+            count += 1
+            elem.clear()
+        elif elem.tag == "part":
+            # partwise files close the first part after its measures
+            return count
+    return 0
+
+def expected_outputs(total_measures: int) -> Set[str]:
+    """File names process_song writes for a song with this many measures"""
+    names = {f"measure_{num}.musicxml" for num in range(1, total_measures + 1)}
+    for size in [2, 3]:
+        for start in range(1, total_measures - size + 2):
+            names.add(f"measures_{start}-{start + size - 1}.musicxml")
+    return names
+
+def read_score(input_file: Path) -> ET.Element:
+    """Root element of a .musicxml file, or of the score inside an .mxl archive"""
+    if input_file.suffix == ".mxl":
+        with zipfile.ZipFile(input_file) as zf:
+            rootfile = _mxl_rootfile(zf)
+            if rootfile is None:
+                raise ValueError(f"No rootfile in {input_file}")
+            return ET.fromstring(zf.read(rootfile))
+    return ET.parse(input_file).getroot()
+
+# <attributes> children in schema order; the ones up to transpose carry over
+# from earlier measures and stay in effect until changed
+_ATTRIBUTE_ORDER = {tag: i for i, tag in enumerate((
+    "footnote", "level", "divisions", "key", "time", "staves", "part-symbol", "instruments",
+    "clef", "staff-details", "transpose", "for-part", "directive", "measure-style",
+))}
+_CARRIED_ATTRIBUTES = {"divisions", "key", "time", "staves", "part-symbol", "instruments",
+                       "clef", "staff-details", "transpose"}
+
+class PartMeasures:
+    """A part's measures, indexed by number, with the attributes in effect at each one"""
+
+    def __init__(self, part: ET.Element):
+        self.part = part
+        self.measures = part.findall("measure")
+        self.index = {}
+        self.carried = []
+        state = {}
+        for i, measure in enumerate(self.measures):
+            self.index.setdefault(measure.get("number"), i)
+            self.carried.append(dict(state))
+            for attributes in measure.findall("attributes"):
+                for child in attributes:
+                    if child.tag in _CARRIED_ATTRIBUTES:
+                        state[(child.tag, child.get("number"))] = child
+
+    def excerpt(self, start: int, end: int) -> Optional[ET.Element]:
+        """A copy of the part holding measures start..end, or None if either is missing"""
+        first = self.index.get(str(start))
+        last = self.index.get(str(end))
+        if first is None or last is None or last < first:
+            return None
+        part = ET.Element("part", self.part.attrib)
+        part.text = self.part.text
+        opening = copy.deepcopy(self.measures[first])
+        _carry_attributes(opening, self.carried[first])
+        part.append(opening)
+        part.extend(self.measures[first + 1:last + 1])
+        return part
+
+def _carry_attributes(measure: ET.Element, carried: Dict[Tuple[str, Optional[str]], ET.Element]):
+    """Give an excerpt's opening measure the key, time, clef etc. set in earlier measures"""
+    if not carried:
+        return
+    leading = None
+    for child in measure:
+        if child.tag == "attributes":
+            leading = child
+            break
+        if child.tag in ("note", "backup", "forward"):
+            break
+    if leading is None:
+        leading = ET.Element("attributes")
+        pos = 0
+        while pos < len(measure) and measure[pos].tag == "print":
+            pos += 1
+        measure.insert(pos, leading)
+    present = {(child.tag, child.get("number")) for child in leading}
+    merged = list(leading) + [e for key, e in carried.items() if key not in present]
+    merged.sort(key=lambda e: _ATTRIBUTE_ORDER.get(e.tag, len(_ATTRIBUTE_ORDER)))
+    leading[:] = merged
+
+def _xml_header(version: str) -> bytes:
+    """XML declaration and a partwise DOCTYPE matching the score's MusicXML version"""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML {version} Partwise//EN" '
+        '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+    ).encode()
+
+def write_excerpt(root: ET.Element, parts: List[PartMeasures], start: int, end: int, out_path: Path) -> bool:
+    """Write measures start..end of every part as a standalone score; False if there are none"""
+    excerpt = ET.Element(root.tag, root.attrib)
+    excerpt.text = root.text
+    # score header without the page credits, then the trimmed parts
+    excerpt.extend(child for child in root if child.tag not in ("part", "credit"))
+    for pm in parts:
+        part = pm.excerpt(start, end)
+        if part is None:
+            return False
+        excerpt.append(part)
+    with open(out_path, "wb") as fh:
+        # version is optional and defaults to 1.0 in the MusicXML schema
+        fh.write(_xml_header(root.get("version", "1.0")))
+        fh.write(ET.tostring(excerpt))
+    return True
+
+def timewise_to_partwise(root: ET.Element) -> ET.Element:
+    """Regroup a score-timewise tree (measures holding parts) as score-partwise"""
+    partwise = ET.Element("score-partwise", root.attrib)
+    partwise.text = root.text
+    parts: Dict[str, ET.Element] = {}
+    for child in root:
+        if child.tag != "measure":
+            partwise.append(child)
+            continue
+        for part_measure in child.findall("part"):
+            part_id = part_measure.get("id")
+            if part_id not in parts:
+                parts[part_id] = ET.SubElement(partwise, "part", part_measure.attrib)
+            measure = ET.SubElement(parts[part_id], "measure", child.attrib)
+            measure.extend(part_measure)
+    return partwise
+
+def music21_excerpts(input_file: Path) -> Tuple[int, Callable[[int, int, Path], bool]]:
+    """Parse a score layout the ElementTree path doesn't recognise with music21
+    Returns: (total measures, writer with the same signature as a bound write_excerpt)
+    """
+    # only these scores need music21, so partwise files don't pay for the import
+    from music21 import converter
+
+    score = converter.parse(str(input_file))
+
+    def write(start: int, end: int, out_path: Path) -> bool:
+        measures = score.measures(start, end)
+        if not measures or not measures.parts:
+            return False
+        measures.write("musicxml", fp=str(out_path))
+        return True
+
+    return len(score.parts[0].measureOffsetMap()), write
+
 def process_song(input_file: Path, output_dir: Path):
     """Process a single song file into measures and measure combinations
     Returns: (folder_name, number of single measures, number of combinations)
     """
-    # Create normalized folder name from song file
-    song_folder = normalize_name(input_file.name)
+    # Normalized name from the song file; used for both the folder and the IDs
+    song_folder = song_id_prefix = normalize_name(input_file.name)
     measures_dir = output_dir / song_folder
     measures_dir.mkdir(exist_ok=True)
+    dest_song = measures_dir / input_file.name
 
-    # Parse score using music21
+    # List the folder once; existence checks below are set lookups
+    existing = {e.name for e in os.scandir(measures_dir)}
+
+    # Nothing to do if a previous run already wrote every output
+    if dest_song.name in existing:
+        total_measures = count_measures(input_file)
+        expected = expected_outputs(total_measures)
+        if total_measures and expected <= existing:
+            print(f"All {len(expected)} outputs exist for {input_file}, skipping")
+            return song_folder, total_measures, len(expected) - total_measures
+
+    # Parse the MusicXML once; excerpts are cut straight from its measure elements
     print(f"Parsing {input_file}")
-    score = converter.parse(str(input_file))
+    root = read_score(input_file)
+    if root.tag == "score-timewise":
+        root = timewise_to_partwise(root)
+    if root.tag == "score-partwise":
+        parts = [PartMeasures(part) for part in root.findall("part")]
+        # Get total measures from the first part
+        total_measures = len(parts[0].measures) if parts else 0
+        write = partial(write_excerpt, root, parts)
+    else:
+        print(f"Falling back to music21 for {root.tag} in {input_file}")
+        try:
+            total_measures, write = music21_excerpts(input_file)
+        except Exception as e:
+            print(f"Failed to parse {input_file}: {e}")
+            return song_folder, 0, 0
 
     # Copy original file to song directory
-    dest_song = measures_dir / input_file.name
-    if not dest_song.exists():
-        score.write(fp=str(dest_song))
+    if dest_song.name not in existing:
+        shutil.copyfile(input_file, dest_song)
 
-    # Get total measures using measureOffsetMap
-    total_measures = len(score.parts[0].measureOffsetMap())
     print(f"Found {total_measures} measures")
 
     # Track counts for reporting
     single_count = 0
     combo_count = 0
-    
-    # Create normalized folder name for IDs
-    song_id_prefix = normalize_name(input_file.name)
 
     # Extract single measures
     for num in range(1, total_measures + 1):
         measure_id = f"{song_id_prefix}|measure{num}"
         out_path = measures_dir / f"measure_{num}.musicxml"
         
-        if out_path.exists():
+        if out_path.name in existing:
             print(f"Skipping existing {out_path}")
             single_count += 1
             continue
 
         try:
-            measure = score.measures(num, num)
-            if not measure or not measure.parts:
+            if not write(num, num, out_path):
                 print(f"No content in measure {num}")
                 continue
 
-            measure.write("musicxml", fp=str(out_path))
             print(f"Created {out_path} with ID {measure_id}")
             single_count += 1
 
@@ -73,18 +271,16 @@ def process_song(input_file: Path, output_dir: Path):
             measure_id = f"{song_id_prefix}|measure{start}-{end}"
             out_path = measures_dir / f"measures_{start}-{end}.musicxml"
             
-            if out_path.exists():
+            if out_path.name in existing:
                 print(f"Skipping existing {out_path}")
                 combo_count += 1
                 continue
 
             try:
-                measures = score.measures(start, end)
-                if not measures or not measures.parts:
+                if not write(start, end, out_path):
                     print(f"No content in measures {start}-{end}")
                     continue
 
-                measures.write("musicxml", fp=str(out_path))
                 print(f"Created {out_path} with ID {measure_id}")
                 combo_count += 1
 
@@ -93,24 +289,38 @@ def process_song(input_file: Path, output_dir: Path):
 
     return song_folder, single_count, combo_count
 
+def process_songs(input_files: List[Path], output_dir: Path) -> List[Tuple[Path, Tuple[str, int, int]]]:
+    """Process songs that share an output folder, in order, in one worker"""
+    return [(f, process_song(f, output_dir)) for f in input_files]
+
 def main():
     # Always process files in frontend data directory
     input_dir = Path("../frontend/public/data")
     input_dir.mkdir(exist_ok=True)
 
-    # Process all .mxl files first
-    for f in input_dir.glob("*.mxl"):
-        if "_measure" not in f.name:  # skip any existing measure files
-            print(f"Processing {f}")
-            folder, singles, combos = process_song(f, input_dir)
-            print(f"-> Created {folder}/ with {singles} single measures and {combos} combinations")
+    # All .mxl files first, then any standalone .musicxml files,
+    # skipping any existing measure files
+    song_files = [
+        f for pattern in ("*.mxl", "*.musicxml")
+        for f in input_dir.glob(pattern)
+        if "_measure" not in f.name
+    ]
 
-    # Then any standalone .musicxml files
-    for f in input_dir.glob("*.musicxml"):
-        if "_measure" not in f.name:  # skip any existing measure files
-            print(f"Processing {f}")
-            folder, singles, combos = process_song(f, input_dir)
-            print(f"-> Created {folder}/ with {singles} single measures and {combos} combinations")
+    # Songs are independent, so parse them in parallel. Files that normalize to
+    # the same folder stay together so they never write the same outputs at once.
+    by_folder: Dict[str, List[Path]] = {}
+    for f in song_files:
+        by_folder.setdefault(normalize_name(f.name), []).append(f)
+
+    # spawn gives each worker a fresh interpreter rather than a fork of the parent
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as executor:
+        for results in executor.map(partial(process_songs, output_dir=input_dir), by_folder.values()):
+            for f, (folder, singles, combos) in results:
+                print(f"Processed {f}")
+                print(f"-> Created {folder}/ with {singles} single measures and {combos} combinations")
+
+# practice_sessions.rating stores the index into this tuple
+RATING_NAMES = ('snooze', 'hard', 'medium', 'easy')
 
 class ProficiencyLevel(Enum):
     PROFICIENT = 4
@@ -119,12 +329,17 @@ class ProficiencyLevel(Enum):
     UNLEARNED = 1
 
 class MeasureGroup:
+    __slots__ = ('id', 'start', 'end', 'best_rating', 'practice_count', 'has_hard', 'last_ratings')
+
     def __init__(self, id: str, start: int, end: int):
         self.id = id
         self.start = start
         self.end = end
         self.best_rating = "unrated"
-        self.all_ratings: List[str] = []
+        self.practice_count = 0
+        self.has_hard = False
+        # the three most recent ratings, oldest first
+        self.last_ratings: Deque[str] = deque(maxlen=3)
     
     @property
     def size(self) -> int:
@@ -132,48 +347,63 @@ class MeasureGroup:
     
     @property
     def proficiency(self) -> ProficiencyLevel:
-        if not self.all_ratings:
+        if not self.practice_count:
             return ProficiencyLevel.UNLEARNED
             
-        if "hard" in self.all_ratings:
+        if self.has_hard:
             return ProficiencyLevel.NEEDS_PRACTICE
             
-        if all(r == "easy" for r in self.last_n_ratings(3)):
+        # fewer than three sessions still counts as proficient
+        last = tuple(self.last_ratings)
+        if len(last) < 3 or last == ("easy", "easy", "easy"):
             return ProficiencyLevel.PROFICIENT
             
-        if all(r in ["easy", "medium"] for r in self.last_n_ratings(2)):
+        if last[-2] in ("easy", "medium") and last[-1] in ("easy", "medium"):
             return ProficiencyLevel.DECENT
             
         return ProficiencyLevel.NEEDS_PRACTICE
-    
-    def last_n_ratings(self, n: int) -> List[str]:
-        return self.all_ratings[-n:] if len(self.all_ratings) >= n else []
 
 def get_measure_proficiencies(db, song_id: int) -> Dict[str, MeasureGroup]:
     """Get all measure groups and their practice history"""
     groups: Dict[str, MeasureGroup] = {}
     
     # First get all measure groups
+    # Columns are fixed, so unpack rows positionally; this works with either row factory
     rows = db.execute("""
         SELECT id, start_measure, end_measure 
         FROM measure_groups 
         WHERE song_id = ?
-    """, (song_id,)).fetchall()
+    """, (song_id,))
     
-    for row in rows:
-        groups[row['id']] = MeasureGroup(row['id'], row['start_measure'], row['end_measure'])
+    for gid, start, end in rows:
+        groups[gid] = MeasureGroup(gid, start, end)
     
-    # Then get all practice history
+    # Then summarize practice history per group: session count, whether it was
+    # ever rated hard, and its last three ratings (oldest first)
     practice_rows = db.execute("""
-        SELECT measure_group_id, rating 
-        FROM practice_sessions 
-        WHERE song_id = ?
-        ORDER BY practiced_at ASC
-    """, (song_id,)).fetchall()
+        SELECT measure_group_id, rating, total, has_hard
+        FROM (
+            SELECT
+                measure_group_id,
+                rating,
+                ROW_NUMBER() OVER (
+                    PARTITION BY measure_group_id ORDER BY practiced_at DESC, id DESC
+                ) AS rn,
+                COUNT(*) OVER (PARTITION BY measure_group_id) AS total,
+                MAX(rating = :hard) OVER (PARTITION BY measure_group_id) AS has_hard
+            FROM practice_sessions
+            WHERE song_id = :song_id
+        )
+        WHERE rn <= 3
+        ORDER BY measure_group_id, rn DESC
+    """, {"song_id": song_id, "hard": RATING_NAMES.index("hard")})
     
-    for row in practice_rows:
-        if row['measure_group_id'] in groups:
-            groups[row['measure_group_id']].all_ratings.append(row['rating'])
+    for mgid, rating, total, has_hard in practice_rows:
+        group = groups.get(mgid)
+        if group is not None:
+            group.practice_count = total
+            group.has_hard = bool(has_hard)
+            group.last_ratings.append(RATING_NAMES[rating])
     
     return groups
 
@@ -183,37 +413,127 @@ def categorize_measures(groups: Dict[str, MeasureGroup]) -> Dict[ProficiencyLeve
         level: set() for level in ProficiencyLevel
     }
     
-    # First process multi-measure groups
-    multi_measures = {id: group for id, group in groups.items() if group.size > 1}
-    for id, group in multi_measures.items():
-        # Check if component measures are decent
-        component_measures = {
-            mid: g for mid, g in groups.items() 
-            if g.size == 1 and g.start >= group.start and g.end <= group.end
-        }
-        
-        if all(m.proficiency >= ProficiencyLevel.DECENT for m in component_measures.values()):
-            if group.proficiency == ProficiencyLevel.UNLEARNED:
+    # Work out each group's level once, then keep the singles as flat per-measure
+    # data: below_decent[m] counts singles numbered below m that aren't decent yet,
+    # so a multi-measure group is checked with one subtraction over its span
+    levels = {id: group.proficiency for id, group in groups.items()}
+    singles = [group for group in groups.values() if group.size == 1]
+    decent = ProficiencyLevel.DECENT.value
+    last_measure = max((group.end for group in groups.values()), default=0)
+    below_decent = [0] * (last_measure + 2)
+    for group in singles:
+        if levels[group.id].value < decent:
+            below_decent[group.start + 1] += 1
+    for m in range(1, len(below_decent)):
+        below_decent[m] += below_decent[m - 1]
+
+    # First process multi-measure groups whose component measures are all decent
+    for id, group in groups.items():
+        if group.size > 1 and below_decent[group.end + 1] == below_decent[group.start]:
+            level = levels[id]
+            if level == ProficiencyLevel.UNLEARNED:
                 buckets[ProficiencyLevel.NEEDS_PRACTICE].add(id)
             else:
-                buckets[group.proficiency].add(id)
+                buckets[level].add(id)
     
     # Then process single measures
-    single_measures = {id: group for id, group in groups.items() if group.size == 1}
-    for id, group in single_measures.items():
-        if group.proficiency == ProficiencyLevel.UNLEARNED:
+    for group in singles:
+        id = group.id
+        level = levels[id]
+        if level == ProficiencyLevel.UNLEARNED:
             # Only add to NEEDS_PRACTICE if that bucket is empty
             if not buckets[ProficiencyLevel.NEEDS_PRACTICE]:
                 buckets[ProficiencyLevel.NEEDS_PRACTICE].add(id)
             else:
                 buckets[ProficiencyLevel.UNLEARNED].add(id)
         else:
-            buckets[group.proficiency].add(id)
+            buckets[level].add(id)
     
     return buckets
 
 def get_next_measure(db, song_id: int) -> Tuple[str, ProficiencyLevel]:
     """Get the next measure to practice"""
+    # Common case: the NEEDS_PRACTICE bucket isn't empty. SQL applies the same
+    # proficiency rules as MeasureGroup and categorize_measures and returns its
+    # least-practiced member, so no groups need building in Python.
+    row = db.execute("""
+        WITH ranked AS (
+            SELECT
+                measure_group_id,
+                rating,
+                ROW_NUMBER() OVER (
+                    PARTITION BY measure_group_id ORDER BY practiced_at DESC, id DESC
+                ) AS rn,
+                COUNT(*) OVER (PARTITION BY measure_group_id) AS total,
+                MAX(rating = :hard) OVER (PARTITION BY measure_group_id) AS has_hard
+            FROM practice_sessions
+            WHERE song_id = :song_id
+        ),
+        stats AS (
+            SELECT
+                measure_group_id,
+                MAX(total) AS total,
+                MAX(has_hard) AS has_hard,
+                MIN(rating = :easy) AS last3_easy,
+                MIN(CASE WHEN rn <= 2 THEN rating >= :medium END) AS last2_decent
+            FROM ranked
+            WHERE rn <= 3
+            GROUP BY measure_group_id
+        ),
+        levels AS (
+            SELECT
+                mg.id,
+                mg.start_measure,
+                mg.end_measure,
+                COALESCE(s.total, 0) AS total,
+                -- ProficiencyLevel values
+                CASE
+                    WHEN s.total IS NULL THEN 1
+                    WHEN s.has_hard THEN 2
+                    WHEN s.total < 3 OR s.last3_easy THEN 4
+                    WHEN s.last2_decent THEN 3
+                    ELSE 2
+                END AS level
+            FROM measure_groups mg
+            LEFT JOIN stats s ON s.measure_group_id = mg.id
+            WHERE mg.song_id = :song_id
+        ),
+        -- multi-measure groups not yet proficient whose singles are all decent
+        multis AS (
+            SELECT g.*
+            FROM levels g
+            WHERE g.start_measure < g.end_measure AND g.level <= 2 AND NOT EXISTS (
+                SELECT 1 FROM levels c
+                WHERE c.start_measure = c.end_measure
+                  AND c.start_measure BETWEEN g.start_measure AND g.end_measure
+                  AND c.level < 3
+            )
+        ),
+        first_single AS (
+            SELECT * FROM levels
+            WHERE start_measure = end_measure AND level <= 2
+            ORDER BY start_measure
+            LIMIT 1
+        )
+        SELECT id FROM (
+            SELECT * FROM multis
+            UNION ALL
+            SELECT * FROM levels WHERE start_measure = end_measure AND level = 2
+            UNION ALL
+            -- an unlearned single joins the bucket if it is still empty when reached
+            SELECT * FROM first_single WHERE level = 1 AND NOT EXISTS (SELECT 1 FROM multis)
+        )
+        ORDER BY total, start_measure, end_measure
+        LIMIT 1
+    """, {
+        "song_id": song_id,
+        "hard": RATING_NAMES.index("hard"),
+        "medium": RATING_NAMES.index("medium"),
+        "easy": RATING_NAMES.index("easy"),
+    }).fetchone()
+    if row is not None:
+        return row[0], ProficiencyLevel.NEEDS_PRACTICE
+
     groups = get_measure_proficiencies(db, song_id)
     buckets = categorize_measures(groups)
     
@@ -223,7 +543,7 @@ def get_next_measure(db, song_id: int) -> Tuple[str, ProficiencyLevel]:
             # Get the measure with fewest practices from this bucket
             measure_id = min(
                 buckets[level],
-                key=lambda id: len(groups[id].all_ratings)
+                key=lambda id: groups[id].practice_count
             )
             return measure_id, level
     
@@ -233,3 +553,6 @@ def get_next_measure(db, song_id: int) -> Tuple[str, ProficiencyLevel]:
     
     # Otherwise return random proficient measure
     return next(iter(buckets[ProficiencyLevel.PROFICIENT])), ProficiencyLevel.PROFICIENT
+
+if __name__ == "__main__":
+    main()